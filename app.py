@@ -7,14 +7,16 @@ import pandas as pd
 import sqlite3  # Still needed for sqlite3.Error in _save_form_data
 from datetime import date
 import re # For parsing target strings
+import threading
 # hashlib will be imported by database.py
 
 from database import (
     DB_NAME,
-    get_db_connection,
+    db_conn,
     init_db,
     hash_password,
     verify_password,
+    password_needs_rehash,
     create_user_in_db,
     get_user_from_db,
     update_user_password,
@@ -49,10 +51,18 @@ input, .stSlider > div {
 )
 
 # --- Database Setup & Migration ---
-# All DB related functions (get_db_connection, init_db, etc.) and DB_NAME
+# All DB related functions (db_conn, init_db, etc.) and DB_NAME
 # are now imported from database.py
 
-init_db()  # Initialize database and tables on app startup
+
+@st.cache_resource
+def _init_db_once():
+    """Runs the schema setup/migration once per server process, not per rerun."""
+    init_db()
+    return True
+
+
+_init_db_once()  # Initialize database and tables on app startup
 
 
 # --- Authentication Helpers ---
@@ -87,6 +97,68 @@ weekly_resistance = {
         {"exercise": "Chest-supported Row", "target": "3×10"},
     ],
 }
+# Static Guide-tab table, built once at import rather than on every rerun
+weekly_template = pd.DataFrame(
+    [
+        ["Mon", "Back-squat; Hip-thrust", "Mini-band"],
+        ["Tue", "Bench; OHP; Dips", "Shoulder ER"],
+        ["Wed", "Mobility Flow", "Dynamic only"],
+        ["Thu AM", "Deadlift; RDL", ""],
+        ["Thu PM", "HIIT 4×4", "VO₂-max"],
+        ["Fri", "Pull-up; Row", "Cuff"],
+        ["Sat", "Zone-2 Run", ""],
+        ["Sun", "Rest + Mobility", ""],
+    ],
+    columns=["Day", "Main Work", "Notes"],
+)
+# Lookups derived once from weekly_resistance for the Resistance tab
+day_exercises = {
+    day: [e["exercise"] for e in exercises]
+    for day, exercises in weekly_resistance.items()
+}
+exercise_targets = {
+    (day, e["exercise"]): e["target"]
+    for day, exercises in weekly_resistance.items()
+    for e in exercises
+}
+
+
+# Rows per table shown in the Logs tab before "Load more" is needed
+LOGS_PAGE_SIZE = 500
+MAX_WEIGHT_KG = 150.0  # Upper bound of the Resistance weight sliders
+
+
+# --- SQL Statements ---
+# Module-level constants keep the statement text identical across reruns, so
+# sqlite3's per-connection statement cache can reuse the prepared statement.
+RESISTANCE_INSERT_SQL = "INSERT INTO resistance(user_id,date,week,day,exercise,set_number,target,actual_weight,actual_reps,rir) VALUES(?,?,?,?,?,?,?,?,?,?)"
+MOBILITY_INSERT_SQL = "INSERT INTO mobility(user_id,date,prep_done,joint_flow_done,animal_circuit_done,cuff_finisher_done) VALUES(?,?,?,?,?,?)"
+CARDIO_INSERT_SQL = "INSERT INTO cardio(user_id,date,type,duration_min,avg_hr) VALUES(?,?,?,?,?)"
+USER_METRICS_INSERT_SQL = "INSERT INTO user_metrics (user_id, date, height_cm, weight_kg, sex, age, body_fat_percentage) VALUES (?, ?, ?, ?, ?, ?, ?)"
+
+# Columns load_table reads per table; id and user_id are never displayed.
+TABLE_COLUMNS = {
+    "resistance": (
+        "date", "week", "day", "exercise", "set_number", "target",
+        "actual_weight", "actual_reps", "rir",
+    ),
+    "mobility": (
+        "date", "prep_done", "joint_flow_done", "animal_circuit_done",
+        "cuff_finisher_done",
+    ),
+    "cardio": ("date", "type", "duration_min", "avg_hr"),
+    "user_metrics": (
+        "date", "height_cm", "weight_kg", "sex", "age", "body_fat_percentage",
+    ),
+}
+# load_table's default statements, built once instead of on every cache miss
+LOAD_TABLE_SQL = {
+    name: f"SELECT {', '.join(cols)} FROM {name} WHERE user_id = ? ORDER BY date DESC"
+    for name, cols in TABLE_COLUMNS.items()
+}
+# Shared result for reads without a logged-in user; read-only like every
+# cached frame (see load_table)
+_EMPTY_DF = pd.DataFrame()
 
 
 # --- Helpers ---
@@ -147,8 +219,17 @@ def get_target_params_for_set(target_string, current_set_num):
     return None, None # No specific parameters found for this set number
 
 
-def _save_form_data(insert_query, data_payload, success_message, is_many=False):
-    """Helper to save form data to the database."""
+def _save_form_data(
+    insert_query, data_payload, success_message, is_many=False, dedupe_key=None
+):
+    """Helper to save form data to the database.
+
+    With `dedupe_key`, the last saved payload is kept under that session-state
+    key and an identical re-submit is skipped instead of written again.
+    While "Batch saves" is on, the write is queued in
+    st.session_state.pending_writes for _commit_pending_writes instead; its
+    payload only counts as saved once the queue is committed.
+    """
     if st.session_state.user_id is None:  # General check for logged-in user
         st.error("User not logged in. Cannot save data.")  # pragma: no cover
         return
@@ -158,58 +239,225 @@ def _save_form_data(insert_query, data_payload, success_message, is_many=False):
         st.warning("No data to save.")  # Typically for resistance sets
         return
 
+    if dedupe_key is not None and st.session_state.get(dedupe_key) == data_payload:
+        st.info("No changes since the last save.")
+        return
+
+    if st.session_state.get("batch_saves", False):
+        pending = st.session_state.get("pending_writes")
+        if pending is None:
+            pending = st.session_state.pending_writes = []
+        entry = (insert_query, data_payload, is_many, dedupe_key)
+        if dedupe_key is not None and entry in pending:
+            st.info("Already queued.")
+            return
+        pending.append(entry)
+        st.info(f"Queued: {success_message}")
+        return
+
     # For single inserts, data_payload is a tuple.
-    # An empty tuple would cause c.execute to fail, which is caught by try-except.
+    # An empty tuple would cause conn.execute to fail, which is caught by try-except.
 
-    conn = get_db_connection()
-    c = conn.cursor()
     try:
-        if is_many:
-            c.executemany(insert_query, data_payload)
-        else:
-            c.execute(insert_query, data_payload)
-        conn.commit()
+        with db_conn() as conn:
+            with conn:  # One transaction: commits on success, rolls back on error
+                # Take the write lock up front so every row lands in one commit
+                conn.execute("BEGIN IMMEDIATE")
+                _execute_write(conn, insert_query, data_payload, is_many)
+        _clear_cached_reads({_insert_table(insert_query)})
+        if dedupe_key is not None:
+            st.session_state[dedupe_key] = data_payload
         st.success(success_message)
-        st.cache_data.clear()  # Clear cache after saving new data
     except sqlite3.Error as e:  # pragma: no cover
         st.error(f"Database error: {e}")
-    finally:
-        conn.close()
 
 
-@st.cache_data  # Cache will be specific to user_id due to it being an argument
-def load_table(name, user_id):
-    conn = get_db_connection()
+def _execute_tuples(conn, query, params):
+    """Like conn.execute, but rows come back as plain tuples, not sqlite3.Row."""
+    cur = conn.cursor()
+    cur.row_factory = None  # Positional access is all the hot readers need
+    return cur.execute(query, params)
+
+
+def _read_frame(conn, query, params):
+    """Runs `query` and builds a DataFrame straight from the cursor rows.
+
+    Skips pd.read_sql_query's adapter layer; the `date` column is parsed once
+    here instead of in every chart.
+    """
+    cur = _execute_tuples(conn, query, params)
+    columns = [col[0] for col in cur.description]
+    df = pd.DataFrame.from_records(cur.fetchall(), columns=columns)
+    # Dates are stored as ISO-8601 text; naming the format skips inference
+    df["date"] = pd.to_datetime(df["date"], format="ISO8601")
+    return df
+
+
+# DataFrame readers use st.cache_resource: hits return the cached frame itself
+# instead of unpickling a copy, so callers must treat the result as read-only
+# (take a .copy() before modifying it).
+def load_table(name, user_id, limit=None):
+    """Loads a user's rows from `name`, newest first; `limit` caps the row count.
+
+    Reads only TABLE_COLUMNS[name] rather than every column.
+    """
+    return _load_table(name, user_id, limit, _table_versions().get(name, 0))
+
+
+@st.cache_resource
+def _table_versions():
+    """Write counter per table, shared by every session.
+
+    Bumping a table's counter re-keys its load_table entries, so a save only
+    invalidates the table it wrote to.
+    """
+    return {}
+
+
+@st.cache_resource
+def _table_versions_lock():
+    """Guards the shared _table_versions counters against concurrent saves."""
+    return threading.Lock()
+
+
+# max_entries also evicts the entries left behind by bumped table versions
+@st.cache_resource(ttl=300, max_entries=128, show_spinner=False)
+def _load_table(name, user_id, limit, version):
+    """Cached body of load_table; `version` only takes part in the cache key."""
     # Ensure user_id is not None before querying
     if user_id is None:
-        conn.close()
-        return pd.DataFrame()  # Return empty DataFrame if no user_id
-    df = pd.read_sql_query(
-        f"SELECT * FROM {name} WHERE user_id = ? ORDER BY date DESC",
-        conn,
-        params=(user_id,),
-    )
-    conn.close()
+        return _EMPTY_DF  # No user_id: skip building a fresh empty frame
+    query = LOAD_TABLE_SQL[name]
+    params = (user_id,)
+    if limit is not None:
+        query += " LIMIT ?"
+        params += (limit,)
+    with db_conn() as conn:
+        df = _read_frame(conn, query, params)
     return df
 
 
-@st.cache_data  # Cache will be specific to user_id
-def fetch_last(exercise, set_num, user_id):
-    conn = get_db_connection()
-    # Ensure user_id is not None
-    if user_id is None:
-        conn.close()
-        return None, None, None
-    df = pd.read_sql_query(
-        "SELECT actual_weight, actual_reps, rir FROM resistance WHERE exercise=? AND set_number=? AND user_id = ? ORDER BY date DESC LIMIT 1",
-        conn,
-        params=(exercise, set_num, user_id),
+def _commit_pending_writes():
+    """Writes every queued save in a single BEGIN IMMEDIATE transaction."""
+    pending = st.session_state.get("pending_writes", [])
+    if not pending:
+        st.warning("No pending saves.")
+        return
+
+    try:
+        with db_conn() as conn:
+            with conn:  # One commit for the whole queue; any error rolls it all back
+                conn.execute("BEGIN IMMEDIATE")
+                for insert_query, data_payload, is_many, _ in pending:
+                    _execute_write(conn, insert_query, data_payload, is_many)
+        saved_count = len(pending)
+        _clear_cached_reads({_insert_table(query) for query, _, _, _ in pending})
+        for _, data_payload, _, dedupe_key in pending:
+            if dedupe_key is not None:  # Now actually saved
+                st.session_state[dedupe_key] = data_payload
+        pending.clear()
+        st.success(f"Saved {saved_count} pending entries.")
+    except sqlite3.Error as e:  # pragma: no cover
+        st.error(f"Database error: {e}")  # Queue is kept for a retry
+
+
+def _logout():
+    """Signs the user out and drops their queued, uncommitted saves."""
+    st.session_state.logged_in = False
+    st.session_state.user_id = None
+    st.session_state.username = None
+    st.session_state.pending_writes = []  # Queued saves belong to this user
+
+
+def _execute_write(conn, insert_query, data_payload, is_many):
+    """Runs one save; `is_many` payloads go out as a single multi-row INSERT.
+
+    `insert_query` ends in one VALUES(?,...) group, which is repeated once per
+    row so SQLite prepares and steps one statement instead of one per row.
+    """
+    if not is_many:
+        conn.execute(insert_query, data_payload)
+        return
+    head, row_placeholders = re.split(
+        r"\bVALUES\s*", insert_query, maxsplit=1, flags=re.IGNORECASE
+    )
+    values = ",".join([row_placeholders.strip()] * len(data_payload))
+    conn.execute(
+        f"{head}VALUES {values}", [v for row in data_payload for v in row]
     )
-    conn.close()
-    if not df.empty:
-        r = df.iloc[0]
-        return float(r["actual_weight"]), int(r["actual_reps"]), int(r["rir"])
-    return None, None, None
+
+
+def _insert_table(insert_query):
+    """Returns the table an INSERT statement writes to."""
+    return re.match(r"\s*INSERT INTO\s+(\w+)", insert_query, re.IGNORECASE).group(1)
+
+
+def _clear_cached_reads(tables):
+    """Invalidates the cached reads of `tables` after a write to them.
+
+    Caches of untouched tables stay warm.
+    """
+    versions = _table_versions()
+    with _table_versions_lock():  # Sessions saving at once must not lose a bump
+        for name in tables:
+            versions[name] = versions.get(name, 0) + 1
+    if "resistance" in tables:  # The remaining readers all query resistance
+        fetch_last_sets.clear()
+        load_progress.clear()
+
+
+@st.cache_data(ttl=600, max_entries=256, show_spinner=False)  # Keyed per user_id
+def fetch_last_sets(exercise, user_id):
+    """Returns {set_number: (weight, reps, rir)} with the latest entry of every set.
+
+    One query serves every set of the exercise in the Resistance tab.
+    """
+    if user_id is None:
+        return {}
+    with db_conn() as conn:
+        rows = _execute_tuples(
+            conn,
+            """
+            SELECT set_number, actual_weight, actual_reps, rir FROM (
+                SELECT set_number, actual_weight, actual_reps, rir,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY set_number ORDER BY date DESC, id DESC
+                       ) AS rn
+                FROM resistance
+                WHERE exercise = ? AND user_id = ?
+            )
+            WHERE rn = 1
+            """,
+            (exercise, user_id),
+        ).fetchall()
+    return {
+        set_number: (float(weight), int(reps), int(rir))
+        for set_number, weight, reps, rir in rows
+    }
+
+
+# Read-only shared frame, see load_table
+@st.cache_resource(ttl=300, max_entries=64, show_spinner=False)
+def load_progress(user_id):
+    """Returns each exercise's max weight per day, aggregated by SQLite.
+
+    Columns: exercise, date (datetime), max_weight. Ordered by date.
+    """
+    if user_id is None:
+        return pd.DataFrame(columns=["exercise", "date", "max_weight"])
+    with db_conn() as conn:
+        df = _read_frame(
+            conn,
+            """
+            SELECT exercise, DATE(date) AS date, MAX(actual_weight) AS max_weight
+            FROM resistance
+            WHERE user_id = ?
+            GROUP BY exercise, DATE(date)
+            ORDER BY date
+            """,
+            (user_id,),
+        )
+    return df
 
 
 # --- Login/Signup UI ---
@@ -226,12 +474,19 @@ def show_login_signup_forms():
             login_button = st.form_submit_button("Login")
 
             if login_button:
-                user = get_user_from_db(username)
-                if user and verify_password(user["password_hash"], password):
+                # The password KDF takes a noticeable moment; show progress
+                with st.spinner("Signing in..."):
+                    user = get_user_from_db(username)
+                    password_ok = user is not None and verify_password(
+                        user["password_hash"], password
+                    )
+                    if password_ok and password_needs_rehash(user["password_hash"]):
+                        # Upgrade older hashes while the password is at hand
+                        update_user_password(user["id"], password)
+                if password_ok:
                     st.session_state.logged_in = True
                     st.session_state.user_id = user["id"]
                     st.session_state.username = user["username"]
-                    st.cache_data.clear()  # Clear cache on login
                     st.rerun()
                 else:
                     st.sidebar.error("Invalid username or password")
@@ -252,7 +507,8 @@ def show_login_signup_forms():
                     st.sidebar.error("Username and password cannot be empty.")
                 elif new_password == confirm_password:
                     if len(new_password) >= 4:
-                        user_id = create_user_in_db(new_username, new_password)
+                        with st.spinner("Creating account..."):
+                            user_id = create_user_in_db(new_username, new_password)
                         if user_id:
                             st.sidebar.success("Account created! Please login.")
                         else:
@@ -274,11 +530,23 @@ if not st.session_state.get("logged_in", False):  # Use .get for safety
     )
 else:
     st.sidebar.markdown(f"Logged in as **{st.session_state.username}**")
+    # Batch mode queues saves from every tab and writes them in one transaction
+    st.sidebar.checkbox(
+        "Batch saves",
+        key="batch_saves",
+        help="Queue saves from all tabs and write them together in one commit.",
+    )
+    # The tabs below can queue saves after this is drawn, so the slot is
+    # redrawn at the end of the run if the count changed
+    commit_slot = st.sidebar.empty()
+    pending_count = len(st.session_state.get("pending_writes", []))
+    if pending_count and commit_slot.button(f"Commit all ({pending_count} pending)"):
+        _commit_pending_writes()
+        pending_count = len(st.session_state.get("pending_writes", []))
+        if not pending_count:  # Committed; a failed commit keeps the queue
+            commit_slot.empty()
     if st.sidebar.button("Logout"):
-        st.session_state.logged_in = False
-        st.session_state.user_id = None
-        st.session_state.username = None
-        st.cache_data.clear()  # Clear cache on logout
+        _logout()
         st.rerun()
 
     # --- Main Application with Tabs (only if logged in) ---
@@ -287,7 +555,22 @@ else:
     # Guide Tab (No user-specific data, can remain as is)
     with tabs[0]:
         st.header("📖 4-Week Program Guide")
-        with st.expander("1. Resistance Framework", True):
+        # Streamlit builds every expander body on each rerun, collapsed or
+        # not; a section picker renders only the one being read
+        guide_section = st.radio(
+            "Section",
+            [
+                "1. Resistance Framework",
+                "2. Weekly Template",
+                "3. Warm-up & Failure Rules",
+                "4. Cardio Tweaks",
+                "5. Mobility Flow",
+                "6. Nutrition & Rationale",
+            ],
+            horizontal=True,
+            key="guide_section",
+        )
+        if guide_section == "1. Resistance Framework":
             st.markdown(
                 """
 **Max-strength:** ≥85% 1RM · 1–5 reps · 5–10 sets/ex · 2–5 min rest
@@ -297,23 +580,9 @@ else:
 _Tweaks:_ add 87–90% top set + increase accessory volume to 12–16 weekly sets.
 """
             )
-        with st.expander("2. Weekly Template"):
-            st.table(
-                pd.DataFrame(
-                    [
-                        ["Mon", "Back-squat; Hip-thrust", "Mini-band"],
-                        ["Tue", "Bench; OHP; Dips", "Shoulder ER"],
-                        ["Wed", "Mobility Flow", "Dynamic only"],
-                        ["Thu AM", "Deadlift; RDL", ""],
-                        ["Thu PM", "HIIT 4×4", "VO₂-max"],
-                        ["Fri", "Pull-up; Row", "Cuff"],
-                        ["Sat", "Zone-2 Run", ""],
-                        ["Sun", "Rest + Mobility", ""],
-                    ],
-                    columns=["Day", "Main Work", "Notes"],
-                )
-            )
-        with st.expander("3. Warm-up & Failure Rules"):
+        elif guide_section == "2. Weekly Template":
+            st.table(weekly_template)
+        elif guide_section == "3. Warm-up & Failure Rules":
             st.markdown(
                 """
 - Dynamic only; 1–2 ramp sets.
@@ -321,16 +590,16 @@ _Tweaks:_ add 87–90% top set + increase accessory volume to 12–16 weekly set
 - Stop 3–4 reps shy on compounds.
 """
             )
-        with st.expander("4. Cardio Tweaks"):
+        elif guide_section == "4. Cardio Tweaks":
             st.markdown(
                 """
 - **HIIT:** 4×4 or 10-min @90% HRₘₐₓ
 - **Endurance:** ≥60min Z2
 """
             )
-        with st.expander("5. Mobility Flow"):
+        elif guide_section == "5. Mobility Flow":
             st.markdown("Prep, Joint, Animal, Cuff circuits as outlined.")
-        with st.expander("6. Nutrition & Rationale"):
+        elif guide_section == "6. Nutrition & Rationale":
             c1, c2 = st.columns(2)
             with c1:
                 st.markdown(
@@ -349,75 +618,80 @@ _Tweaks:_ add 87–90% top set + increase accessory volume to 12–16 weekly set
         c1, c2 = st.columns(2)
         with c1:
             d = st.date_input("Date", date.today())
+            d_iso = d.isoformat()  # Dates are stored as ISO-8601 text
             week = st.selectbox("Week", [1, 2, 3, 4])
             day = st.selectbox("Day", list(weekly_resistance.keys()))
-            ex = st.selectbox(
-                "Exercise", [e["exercise"] for e in weekly_resistance[day]]
-            )
+            ex = st.selectbox("Exercise", day_exercises[day])
         with c2:
-            target = next(
-                e["target"] for e in weekly_resistance[day] if e["exercise"] == ex
-            )
+            target = exercise_targets[(day, ex)]
             repeat = st.checkbox("Repeat last session")
             sets = st.number_input("# Sets", 1, 10, 3)
         entries = []
         pw, pr, pi = None, None, None # Previous set's weight, reps, RIR
         current_user_id = st.session_state.user_id
         slider_step = 0.5 # Define slider step for weight
+        last_sets = {}
+        if repeat:
+            # One cached query for every set's previous values; saves clear it
+            last_sets = fetch_last_sets(ex, current_user_id)
+        else:
+            # The 1RM is the same for every set, so look it up once
+            one_rm_data = get_latest_1rm(current_user_id, ex)
+
+        # Sliders inside a form don't rerun the script on every change; only
+        # "Save Resistance" submits them
+        with st.form("res_sets_form"):
+            for i in range(1, sets + 1): # For each set
+                w0, r0, i0 = None, None, None # Default values for current set's sliders
+
+                if repeat:
+                    # If repeating last session, use the data for this specific set number
+                    w0, r0, i0 = last_sets.get(i, (None, None, None))
+                else:
+                    # Not repeating: try to calculate from 1RM or use previous set's values
+                    target_percentage, target_reps_prog = get_target_params_for_set(target, i)
+
+                    # Initialize with previous set's values (or None if first set)
+                    w0_prev, r0_prev, i0_prev = pw, pr, pi
+                    w0, r0, i0 = w0_prev, r0_prev, i0_prev
+
+                    if one_rm_data and target_percentage is not None:
+                        one_rm_value = one_rm_data["one_rep_max"]
+                        calculated_w = (target_percentage / 100.0) * one_rm_value
+                        w0 = round(calculated_w / slider_step) * slider_step # Use calculated weight
+
+                        if target_reps_prog is not None:
+                            r0 = target_reps_prog # Use reps from program if available
+                        # If target_reps_prog is None, r0 remains r0_prev (from previous set or None)
+                        # i0 remains i0_prev (from previous set or None)
+                    # If no 1RM or no target_percentage, w0, r0, i0 remain as previous set's values
+
+                with st.expander(f"Set {i}"):
+                    # Use (w0 or 0) for weight, (r0 or 6) for reps, (i0 or 3) for RIR as slider defaults
+                    aw = st.slider(
+                        "Weight (kg)", 0.0, MAX_WEIGHT_KG, float(w0) if w0 is not None else 0.0, step=slider_step, key=f"res_w_{i}"
+                    )
+                    ar = st.slider("Reps", 1, 20, int(r0) if r0 is not None else 6, key=f"res_r_{i}")
+                    rir = st.slider("RIR", 0, 5, int(i0) if i0 is not None else 3, key=f"res_i_{i}")
 
-        for i in range(1, sets + 1): # For each set
-            w0, r0, i0 = None, None, None # Default values for current set's sliders
-
-            if repeat:
-                # If repeating last session, fetch data for this specific set number
-                w0_db, r0_db, i0_db = fetch_last(ex, i, current_user_id)
-                w0, r0, i0 = w0_db, r0_db, i0_db
-            else:
-                # Not repeating: try to calculate from 1RM or use previous set's values
-                one_rm_data = get_latest_1rm(current_user_id, ex)
-                target_percentage, target_reps_prog = get_target_params_for_set(target, i)
-
-                # Initialize with previous set's values (or None if first set)
-                w0_prev, r0_prev, i0_prev = pw, pr, pi
-                w0, r0, i0 = w0_prev, r0_prev, i0_prev
-
-                if one_rm_data and target_percentage is not None:
-                    one_rm_value = one_rm_data["one_rep_max"]
-                    calculated_w = (target_percentage / 100.0) * one_rm_value
-                    w0 = round(calculated_w / slider_step) * slider_step # Use calculated weight
-
-                    if target_reps_prog is not None:
-                        r0 = target_reps_prog # Use reps from program if available
-                    # If target_reps_prog is None, r0 remains r0_prev (from previous set or None)
-                    # i0 remains i0_prev (from previous set or None)
-                # If no 1RM or no target_percentage, w0, r0, i0 remain as previous set's values
-
-            with st.expander(f"Set {i}"):
-                maxw = float(150) # Max weight for slider
-                # Use (w0 or 0) for weight, (r0 or 6) for reps, (i0 or 3) for RIR as slider defaults
-                aw = st.slider(
-                    "Weight (kg)", 0.0, maxw, float(w0 if w0 is not None else 0), step=slider_step, key=f"res_w_{i}"
-                )
-                ar = st.slider("Reps", 1, 20, int(r0 if r0 is not None else 6), key=f"res_r_{i}")
-                rir = st.slider("RIR", 0, 5, int(i0 if i0 is not None else 3), key=f"res_i_{i}")
-
-                pw, pr, pi = aw, ar, rir # Update previous set's values for the next iteration
-                # Add user_id to the entry
-                entries.append(
-                    (current_user_id, d, week, day, ex, i, target, aw, ar, rir)
-                )
-        if st.button("Save Resistance"):
-            # The 'if not entries' check is specific and remains here.
-            # The user login check is handled by _save_form_data.
-            if not entries:  # pragma: no cover
-                st.warning("No sets to save.")
-            else:
-                _save_form_data(
-                    insert_query="INSERT INTO resistance(user_id,date,week,day,exercise,set_number,target,actual_weight,actual_reps,rir) VALUES(?,?,?,?,?,?,?,?,?,?)",
-                    data_payload=entries,
-                    success_message="Saved Resistance",
-                    is_many=True,
-                )
+                    pw, pr, pi = aw, ar, rir # Update previous set's values for the next iteration
+                    # Add user_id to the entry
+                    entries.append(
+                        (current_user_id, d_iso, week, day, ex, i, target, aw, ar, rir)
+                    )
+            submitted = st.form_submit_button("Save Resistance")
+            if submitted:
+                # The 'if not entries' check is specific and remains here.
+                # The user login check is handled by _save_form_data.
+                if not entries:  # pragma: no cover
+                    st.warning("No sets to save.")
+                else:
+                    _save_form_data(
+                        insert_query=RESISTANCE_INSERT_SQL,
+                        data_payload=entries,
+                        success_message="Saved Resistance",
+                        is_many=True,
+                    )
 
     # Mobility Tab
     with tabs[2]:
@@ -432,11 +706,12 @@ _Tweaks:_ add 87–90% top set + increase accessory volume to 12–16 weekly set
                 st.session_state.user_id
             )  # Needed to construct data_payload
             # User login check is handled by _save_form_data.
-            data_payload = (current_user_id, d, int(p), int(j), int(a), int(cf))
+            data_payload = (current_user_id, d.isoformat(), int(p), int(j), int(a), int(cf))
             _save_form_data(
-                insert_query="INSERT INTO mobility(user_id,date,prep_done,joint_flow_done,animal_circuit_done,cuff_finisher_done) VALUES(?,?,?,?,?,?)",
+                insert_query=MOBILITY_INSERT_SQL,
                 data_payload=data_payload,
                 success_message="Saved Mobility",
+                dedupe_key="last_saved_mobility",
             )
 
     # Cardio Tab
@@ -454,11 +729,12 @@ _Tweaks:_ add 87–90% top set + increase accessory volume to 12–16 weekly set
                 st.session_state.user_id
             )  # Needed to construct data_payload
             # User login check is handled by _save_form_data.
-            data_payload = (current_user_id, d, t, dur, hr)
+            data_payload = (current_user_id, d.isoformat(), t, dur, hr)
             _save_form_data(
-                insert_query="INSERT INTO cardio(user_id,date,type,duration_min,avg_hr) VALUES(?,?,?,?,?)",
+                insert_query=CARDIO_INSERT_SQL,
                 data_payload=data_payload,
                 success_message="Saved Cardio",
+                dedupe_key="last_saved_cardio",
             )
 
     # Profile Tab
@@ -467,11 +743,12 @@ _Tweaks:_ add 87–90% top set + increase accessory volume to 12–16 weekly set
         current_user_id = st.session_state.user_id
 
         # Load latest metrics for default values in the form
-        latest_metrics_df = load_table("user_metrics", current_user_id)
+        # Loaded once and shared by the form defaults, latest entry and history
+        metrics_df = load_table("user_metrics", current_user_id)
         latest_entry = {}
-        if not latest_metrics_df.empty:
+        if not metrics_df.empty:
             # load_table sorts by date DESC, so iloc[0] is the latest
-            latest_entry = latest_metrics_df.iloc[0].to_dict()
+            latest_entry = metrics_df.iloc[0].to_dict()
 
         with st.form("user_metrics_form"):
             st.markdown("#### Record New Metrics")
@@ -542,7 +819,7 @@ _Tweaks:_ add 87–90% top set + increase accessory volume to 12–16 weekly set
                 sex_to_save = sex if sex != "Not specified" else None
                 data_payload = (
                     current_user_id,
-                    metric_date,
+                    metric_date.isoformat(),
                     height,  # Direct value from number_input
                     weight,  # Direct value from number_input
                     sex_to_save,
@@ -550,22 +827,21 @@ _Tweaks:_ add 87–90% top set + increase accessory volume to 12–16 weekly set
                     body_fat,  # Direct value from number_input
                 )
                 _save_form_data(
-                    insert_query="INSERT INTO user_metrics (user_id, date, height_cm, weight_kg, sex, age, body_fat_percentage) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    insert_query=USER_METRICS_INSERT_SQL,
                     data_payload=data_payload,
                     success_message="Saved User Metrics",
                 )
-                # After saving, data will be reloaded by Streamlit's flow or cache clearing
+                # Re-fetch so the sections below include the entry just saved
+                metrics_df = load_table("user_metrics", current_user_id)
 
         st.divider()
         st.subheader("Latest Recorded Metrics")
-        # Re-fetch to display the absolute latest, including any just saved
-        current_metrics_to_display_df = load_table("user_metrics", current_user_id)
-        if not current_metrics_to_display_df.empty:
-            display_latest = current_metrics_to_display_df.iloc[
+        if not metrics_df.empty:
+            display_latest = metrics_df.iloc[
                 0
             ]  # Already sorted by date DESC
             st.write(
-                f"**Date:** {pd.to_datetime(display_latest['date']).strftime('%Y-%m-%d')}"
+                f"**Date:** {display_latest['date'].strftime('%Y-%m-%d')}"
             )
             if pd.notna(display_latest["height_cm"]):
                 st.write(f"**Height:** {display_latest['height_cm']:.1f} cm")
@@ -584,12 +860,9 @@ _Tweaks:_ add 87–90% top set + increase accessory volume to 12–16 weekly set
 
         st.divider()
         st.subheader("Metrics History")
-        all_metrics_df = load_table("user_metrics", current_user_id)
-        if not all_metrics_df.empty:
-            display_df = all_metrics_df.copy()
-            display_df["date"] = pd.to_datetime(display_df["date"]).dt.strftime(
-                "%Y-%m-%d"
-            )
+        if not metrics_df.empty:
+            display_df = metrics_df.copy()
+            display_df["date"] = display_df["date"].dt.strftime("%Y-%m-%d")
             cols_to_display = [
                 "date",
                 "height_cm",
@@ -611,11 +884,10 @@ _Tweaks:_ add 87–90% top set + increase accessory volume to 12–16 weekly set
             st.subheader("Progress Charts")
             # Chart for Weight
             if (
-                "weight_kg" in all_metrics_df.columns
-                and all_metrics_df["weight_kg"].notna().any()
+                "weight_kg" in metrics_df.columns
+                and metrics_df["weight_kg"].notna().any()
             ):
-                weight_chart_data = all_metrics_df[["date", "weight_kg"]].copy()
-                weight_chart_data["date"] = pd.to_datetime(weight_chart_data["date"])
+                weight_chart_data = metrics_df[["date", "weight_kg"]].copy()
                 weight_chart_data = weight_chart_data.dropna(subset=["weight_kg"])
                 weight_chart_data = weight_chart_data.sort_values(by="date").set_index(
                     "date"
@@ -630,11 +902,10 @@ _Tweaks:_ add 87–90% top set + increase accessory volume to 12–16 weekly set
 
             # Chart for Body Fat
             if (
-                "body_fat_percentage" in all_metrics_df.columns
-                and all_metrics_df["body_fat_percentage"].notna().any()
+                "body_fat_percentage" in metrics_df.columns
+                and metrics_df["body_fat_percentage"].notna().any()
             ):
-                bf_chart_data = all_metrics_df[["date", "body_fat_percentage"]].copy()
-                bf_chart_data["date"] = pd.to_datetime(bf_chart_data["date"])
+                bf_chart_data = metrics_df[["date", "body_fat_percentage"]].copy()
                 bf_chart_data = bf_chart_data.dropna(subset=["body_fat_percentage"])
                 bf_chart_data = bf_chart_data.sort_values(by="date").set_index("date")
                 if not bf_chart_data.empty:
@@ -657,10 +928,18 @@ _Tweaks:_ add 87–90% top set + increase accessory volume to 12–16 weekly set
 
             if change_password_submitted:
                 user = get_user_from_db(st.session_state.username) # Fetch current user details
-                if user and verify_password(user["password_hash"], current_password):
+                with st.spinner("Checking password..."):
+                    password_ok = user is not None and verify_password(
+                        user["password_hash"], current_password
+                    )
+                if password_ok:
                     if new_password == confirm_new_password:
                         if len(new_password) >= 4:
-                            if update_user_password(st.session_state.user_id, new_password):
+                            with st.spinner("Updating password..."):
+                                updated = update_user_password(
+                                    st.session_state.user_id, new_password
+                                )
+                            if updated:
                                 st.success("Password updated successfully.")
                             else: # pragma: no cover
                                 st.error("Failed to update password. Database error.")
@@ -701,7 +980,6 @@ _Tweaks:_ add 87–90% top set + increase accessory volume to 12–16 weekly set
                 if rm_exercise and rm_weight > 0:
                     if save_or_update_1rm(current_user_id, rm_exercise, rm_weight, rm_date.isoformat()):
                         st.success(f"1RM for {rm_exercise} saved successfully.")
-                        st.cache_data.clear() # Clear cache to reflect new 1RM data if displayed elsewhere
                     else: # pragma: no cover
                         st.error("Failed to save 1RM. Database error.")
                 else:
@@ -716,7 +994,7 @@ _Tweaks:_ add 87–90% top set + increase accessory volume to 12–16 weekly set
                 latest_1rms_data.append({
                     "Exercise": ex,
                     "1RM (kg)": latest_rm["one_rep_max"],
-                    "Date": pd.to_datetime(latest_rm["date"]).strftime('%Y-%m-%d')
+                    "Date": latest_rm["date"]  # Already stored as YYYY-MM-DD
                 })
 
         if latest_1rms_data:
@@ -732,30 +1010,56 @@ _Tweaks:_ add 87–90% top set + increase accessory volume to 12–16 weekly set
         if current_user_id is None:  # pragma: no cover
             st.warning("Please log in to see your logs.")
         else:
+            # Tables show the latest `logs_limit` rows; "Load more" pages further
+            # back and "Show all" drops the limit (None) for the full history
+            if "logs_limit" not in st.session_state:
+                st.session_state.logs_limit = LOGS_PAGE_SIZE
+            logs_limit = st.session_state.logs_limit
+            log_frames = {
+                name: load_table(name, current_user_id, logs_limit)
+                for name in ("resistance", "mobility", "cardio")
+            }
             st.subheader("Resistance")
-            st.dataframe(load_table("resistance", current_user_id))
+            st.dataframe(log_frames["resistance"])
             st.subheader("Mobility")
-            st.dataframe(load_table("mobility", current_user_id))
+            st.dataframe(log_frames["mobility"])
             st.subheader("Cardio")
-            st.dataframe(load_table("cardio", current_user_id))
+            st.dataframe(log_frames["cardio"])
+            if logs_limit is not None and any(
+                len(df) == logs_limit for df in log_frames.values()
+            ):
+                more_col, all_col = st.columns(2)
+                if more_col.button("Load more", key="logs_load_more"):
+                    st.session_state.logs_limit += LOGS_PAGE_SIZE
+                    st.rerun()
+                if all_col.button("Show all", key="logs_show_all"):
+                    st.session_state.logs_limit = None
+                    st.rerun()
 
             st.subheader("Progress Charts")
-            df_resistance = load_table("resistance", current_user_id)
-            if not df_resistance.empty:
-                for lift in df_resistance["exercise"].unique():
-                    ddf = df_resistance[
-                        df_resistance["exercise"] == lift
-                    ].copy()  # Use .copy() to avoid SettingWithCopyWarning
-                    ddf["date"] = pd.to_datetime(ddf["date"])
-                    # Ensure data is sorted by date for charting max weight over time
-                    chart_data = (
-                        ddf.sort_values(by="date")
-                        .groupby(pd.Grouper(key="date", freq="D"))["actual_weight"]
-                        .max()
-                        .fillna(0)
+            # Daily maxima over the full history come pre-aggregated from SQLite
+            df_progress = load_progress(current_user_id)
+            if not df_progress.empty:
+                # Charts are only computed for the lifts the user asks for
+                selected_lifts = st.multiselect(
+                    "Show charts for",
+                    df_progress["exercise"].unique(),
+                    key="logs_chart_lifts",
+                )
+                if selected_lifts:
+                    # One column per lift, indexed by day
+                    max_weight_by_day = df_progress.pivot(
+                        index="date", columns="exercise", values="max_weight"
                     )
+                for lift in selected_lifts:
+                    # Daily series for this lift; days without a session show as 0
+                    chart_data = max_weight_by_day[lift].dropna().asfreq("D").fillna(0)
                     if not chart_data.empty:
                         st.markdown(f"**{lift} - Max Weight Over Time**")
                         st.line_chart(chart_data, use_container_width=True, height=200)
             else:
                 st.write("No resistance data yet to display charts.")
+
+    queued_count = len(st.session_state.get("pending_writes", []))
+    if queued_count != pending_count:  # A tab queued a save during this run
+        commit_slot.button(f"Commit all ({queued_count} pending)")
@@ -1,27 +1,170 @@
+import atexit
+import base64
+import hmac
+import os
+import queue
 import sqlite3
 import hashlib
+import threading
+from contextlib import contextmanager
 
 # --- Database Setup & Migration ---
 DB_NAME = "workout_tracker.db"
 
+# Most connections kept open per database. Streamlit runs every rerun on a
+# fresh thread, so connections are pooled by database, not by thread; when
+# all are checked out, db_conn waits for one to be released.
+POOL_SIZE = 4
+# Seconds db_conn waits for a released connection before giving up.
+POOL_TIMEOUT = 30
+# One pool per DB_NAME, so tests that swap the file get a fresh one.
+_pools = {}
+_pools_lock = threading.Lock()
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME, check_same_thread=False)
+
+class _ConnectionPool:
+    """Up to POOL_SIZE connections to one database, reused most-recent first."""
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self.idle = queue.LifoQueue()  # The warmest page cache is reused first
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            can_open = self.opened < POOL_SIZE
+            if can_open:
+                self.opened += 1
+        if not can_open:  # Pool is full: wait for a release
+            try:
+                return self.idle.get(timeout=POOL_TIMEOUT)
+            except queue.Empty:
+                raise sqlite3.OperationalError(
+                    f"no pooled connection to {self.db_name} was released "
+                    f"within {POOL_TIMEOUT}s"
+                ) from None
+        try:
+            return _open_connection(self.db_name)
+        except sqlite3.Error:
+            with self.lock:
+                self.opened -= 1
+            raise
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:  # Never hand out a half-finished transaction
+                conn.rollback()
+        except sqlite3.Error:  # Unusable now: drop it and free its slot
+            with self.lock:
+                self.opened -= 1
+            conn.close()
+            return
+        self.idle.put(conn)
+
+    def close_idle(self):
+        while True:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            with self.lock:
+                self.opened -= 1
+            _optimize_and_close(conn)
+
+
+@contextmanager
+def db_conn():
+    """Lends a pooled connection to DB_NAME for the duration of a `with` block.
+
+    Callers must not close it; it goes back to the pool on exit, with any
+    transaction still open rolled back.
+    """
+    with _pools_lock:
+        pool = _pools.get(DB_NAME)
+        if pool is None:
+            pool = _pools[DB_NAME] = _ConnectionPool(DB_NAME)
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+
+@atexit.register
+def close_db_connections():
+    """Closes every idle pooled connection, for all databases."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_idle()
+
+
+def _optimize_and_close(conn):
+    """Lets SQLite refresh planner stats the connection's queries need, then closes it."""
+    try:
+        conn.execute("PRAGMA optimize")
+    except sqlite3.Error:  # Already closed, or the database is busy
+        pass
+    conn.close()
+
+
+def _open_connection(db_name):
+    # Pooled connections move between threads, though only one uses each at
+    # a time. They live long, so keep more prepared statements around.
+    conn = sqlite3.connect(
+        db_name,
+        check_same_thread=False,
+        cached_statements=256,
+        uri=db_name.startswith("file:"),  # e.g. the tests' shared in-memory DB
+    )
     conn.row_factory = sqlite3.Row  # Access columns by name
+    # WAL lets readers run alongside a writer, and synchronous=NORMAL skips
+    # the per-commit fsync of the main DB file (still safe with WAL; only the
+    # last commits may be lost on power failure, acceptable for this tracker).
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    # Enforce the schema's user_id -> users(id) references; each check is a
+    # primary-key seek on users
+    conn.execute("PRAGMA foreign_keys=ON")
+    # The page cache lives as long as the pooled connection, so give it room
+    conn.execute("PRAGMA cache_size=-64000")  # ~64 MB; negative means KiB
+    conn.execute("PRAGMA mmap_size=268435456")  # 256 MiB
     return conn
 
 
+def _table_columns(cursor, table_name, table_columns):
+    """Returns the column names of `table_name`, reading PRAGMA table_info once.
+
+    `table_columns` is a dict caching the result per table for one init_db run.
+    """
+    if table_name not in table_columns:
+        cursor.execute(f"PRAGMA table_info({table_name})")
+        table_columns[table_name] = {row[1] for row in cursor.fetchall()}
+    return table_columns[table_name]
+
+
 def _add_column_if_not_exists(
-    cursor, table_name, column_name, column_type_with_constraints
+    cursor, table_name, column_name, column_type_with_constraints, table_columns=None
 ):
-    """Helper to add a column to a table if it doesn't already exist."""
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    columns = [row[1] for row in cursor.fetchall()]
+    """Helper to add a column to a table if it doesn't already exist.
+
+    Pass init_db's `table_columns` dict to reuse column lists already read.
+    """
+    if table_columns is None:
+        table_columns = {}
+    columns = _table_columns(cursor, table_name, table_columns)
     if column_name not in columns:
         try:
             cursor.execute(
                 f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type_with_constraints}"
             )
+            columns.add(column_name)
         except sqlite3.OperationalError as e:
             # This check is for "duplicate column name", which might occur in rare scenarios
             # even after the "if column_name not in columns" check.
@@ -31,144 +174,223 @@ def _add_column_if_not_exists(
                 raise
 
 
-def init_db():
-    conn = get_db_connection()
-    c = conn.cursor()
-
-    # Users table
-    c.execute("""CREATE TABLE IF NOT EXISTS users(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password_hash TEXT NOT NULL
-    )""")
-
-    # Create or alter resistance table
-    c.execute("""CREATE TABLE IF NOT EXISTS resistance(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        date TEXT,
-        week INTEGER,
-        day TEXT,
-        exercise TEXT,
-        set_number INTEGER,
-        target TEXT,
-        actual_weight REAL,
-        actual_reps INTEGER,
-        rir INTEGER,
-        FOREIGN KEY (user_id) REFERENCES users(id)
-    )""")
-
-    _add_column_if_not_exists(c, "resistance", "set_number", "INTEGER DEFAULT 1")
-    _add_column_if_not_exists(c, "resistance", "user_id", "INTEGER")
-
-    # Mobility table
-    c.execute("""CREATE TABLE IF NOT EXISTS mobility(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        date TEXT,
-        prep_done INTEGER,
-        joint_flow_done INTEGER,
-        animal_circuit_done INTEGER,
-        cuff_finisher_done INTEGER,
-        FOREIGN KEY (user_id) REFERENCES users(id)
-    )""")
-    _add_column_if_not_exists(c, "mobility", "user_id", "INTEGER")
-
-    # Cardio table
-    c.execute("""CREATE TABLE IF NOT EXISTS cardio(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        date TEXT,
-        type TEXT,
-        duration_min INTEGER,
-        avg_hr INTEGER,
-        FOREIGN KEY (user_id) REFERENCES users(id)
-    )""")
-    _add_column_if_not_exists(c, "cardio", "user_id", "INTEGER")
-
-    # User Metrics table
-    c.execute("""CREATE TABLE IF NOT EXISTS user_metrics(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        date TEXT NOT NULL,
-        height_cm REAL,
-        weight_kg REAL,
-        sex TEXT,
-        age INTEGER,
-        body_fat_percentage REAL,
-        FOREIGN KEY (user_id) REFERENCES users(id)
-    )""")
-
-    # User 1RM table
-    c.execute("""CREATE TABLE IF NOT EXISTS user_1rm(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        exercise TEXT NOT NULL,
-        one_rep_max REAL NOT NULL,
-        date TEXT NOT NULL, -- Date the 1RM was achieved or recorded
-        UNIQUE(user_id, exercise, date), -- Ensure unique 1RM per user, exercise, and date
-        FOREIGN KEY (user_id) REFERENCES users(id)
-    )""")
-
-    # User 1RM table
-    c.execute("""CREATE TABLE IF NOT EXISTS user_1rm(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        exercise TEXT NOT NULL,
-        one_rep_max REAL NOT NULL,
-        date TEXT NOT NULL, -- Date the 1RM was achieved or recorded
-        UNIQUE(user_id, exercise, date), -- Ensure unique 1RM per user, exercise, and date
-        FOREIGN KEY (user_id) REFERENCES users(id)
-    )""")
-
-    # --- Data Migration: Assign existing orphan records to the first user ---
-    c.execute("SELECT id FROM users ORDER BY id LIMIT 1")
-    first_user = c.fetchone()
-
-    if first_user:
-        first_user_id = first_user["id"]
-        tables_to_migrate = ["resistance", "mobility", "cardio"]
-        for table_name in tables_to_migrate:
-            # Check if user_id column exists before trying to update it
-            # This is a safeguard, as previous code should have added it.
-            cols = [
-                row[1]
-                for row in c.execute(f"PRAGMA table_info({table_name})").fetchall()
-            ]
-            if "user_id" in cols:
-                c.execute(
-                    f"UPDATE {table_name} SET user_id = ? WHERE user_id IS NULL",
-                    (first_user_id,),
-                )
+# Bump when init_db gains new tables, columns, indexes or migrations.
+SCHEMA_VERSION = 1
+
+# Table DDL, run by init_db inside its schema transaction.
+SCHEMA_TABLES_SQL = """
+CREATE TABLE IF NOT EXISTS users(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS resistance(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    date TEXT,
+    week INTEGER,
+    day TEXT,
+    exercise TEXT,
+    set_number INTEGER,
+    target TEXT,
+    actual_weight REAL,
+    actual_reps INTEGER,
+    rir INTEGER,
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+
+CREATE TABLE IF NOT EXISTS mobility(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    date TEXT,
+    prep_done INTEGER,
+    joint_flow_done INTEGER,
+    animal_circuit_done INTEGER,
+    cuff_finisher_done INTEGER,
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+
+CREATE TABLE IF NOT EXISTS cardio(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    date TEXT,
+    type TEXT,
+    duration_min INTEGER,
+    avg_hr INTEGER,
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+
+CREATE TABLE IF NOT EXISTS user_metrics(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    height_cm REAL,
+    weight_kg REAL,
+    sex TEXT,
+    age INTEGER,
+    body_fat_percentage REAL,
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+
+CREATE TABLE IF NOT EXISTS user_1rm(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    exercise TEXT NOT NULL,
+    one_rep_max REAL NOT NULL,
+    date TEXT NOT NULL, -- Date the 1RM was achieved or recorded
+    UNIQUE(user_id, exercise, date), -- Ensure unique 1RM per user, exercise, and date
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+"""
+
+# Index DDL, run by init_db once the tables are up to date.
+SCHEMA_INDEXES_SQL = """
+-- Serves fetch_last_sets (WHERE user_id, exercise, newest date per
+-- set_number) as an index range scan; its (user_id, exercise) prefix also
+-- covers the per-exercise progress charts.
+CREATE INDEX IF NOT EXISTS idx_resistance_user_exercise_set_date
+    ON resistance(user_id, exercise, set_number, date DESC);
+
+-- load_table reads each table as WHERE user_id ORDER BY date DESC; these
+-- indexes turn that scan-and-sort into an index walk.
+CREATE INDEX IF NOT EXISTS idx_resistance_user_date ON resistance(user_id, date DESC);
+CREATE INDEX IF NOT EXISTS idx_mobility_user_date ON mobility(user_id, date DESC);
+CREATE INDEX IF NOT EXISTS idx_cardio_user_date ON cardio(user_id, date DESC);
+CREATE INDEX IF NOT EXISTS idx_user_metrics_user_date ON user_metrics(user_id, date DESC);
+"""
+
+
+def _execute_script(cursor, script):
+    """Run each statement of a DDL script within the current transaction."""
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        # complete_statement ignores semicolons inside `--` comments
+        if sqlite3.complete_statement(statement):
+            cursor.execute(statement)
+            statement = ""
 
-    conn.commit()
-    conn.close()
+
+def init_db():
+    with db_conn() as conn:
+        c = conn.cursor()
+        # PRAGMA user_version records the schema applied last; once current,
+        # none of the DDL or migration below needs to run again.
+        if c.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+        table_columns = {}  # Column names per table, shared by the checks below
+
+        # One explicit transaction for all DDL and migration, so bootstrapping a
+        # fresh database costs a single commit instead of one per statement.
+        # executescript() would commit before running, hence _execute_script.
+        with conn:
+            c.execute("BEGIN")
+            _execute_script(c, SCHEMA_TABLES_SQL)
+            # Columns added after the first release; legacy tables may lack them
+            _add_column_if_not_exists(
+                c, "resistance", "set_number", "INTEGER DEFAULT 1", table_columns
+            )
+            _add_column_if_not_exists(c, "resistance", "user_id", "INTEGER", table_columns)
+            _add_column_if_not_exists(c, "mobility", "user_id", "INTEGER", table_columns)
+            _add_column_if_not_exists(c, "cardio", "user_id", "INTEGER", table_columns)
+            # Created after the ALTERs above so legacy tables already have the columns
+            _execute_script(c, SCHEMA_INDEXES_SQL)
+
+            # --- Data Migration: Assign existing orphan records to the first user ---
+            c.execute("SELECT id FROM users ORDER BY id LIMIT 1")
+            first_user = c.fetchone()
+
+            if first_user:
+                first_user_id = first_user["id"]
+                tables_to_migrate = ["resistance", "mobility", "cardio"]
+                for table_name in tables_to_migrate:
+                    # Check if user_id column exists before trying to update it
+                    # This is a safeguard, as previous code should have added it.
+                    if "user_id" not in _table_columns(c, table_name, table_columns):
+                        continue
+                    # Cheap probe first; most databases have no orphans to update
+                    has_orphans = c.execute(
+                        f"SELECT 1 FROM {table_name} WHERE user_id IS NULL LIMIT 1"
+                    ).fetchone()
+                    if has_orphans:
+                        c.execute(
+                            f"UPDATE {table_name} SET user_id = ? WHERE user_id IS NULL",
+                            (first_user_id,),
+                        )
+                # Only mark the schema current once orphans could be assigned; until
+                # the first user exists, init_db keeps retrying the migration.
+                c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+        # Gather stats for the freshly created indexes while we're here
+        c.execute("PRAGMA optimize")
 
 
 # --- Authentication Helpers ---
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+# scrypt cost parameters for new hashes (about 16 MiB and a few tens of ms)
+SCRYPT_N = 2**14
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode()
+
+
+def hash_password(password, salt=None):
+    """Returns a salted scrypt hash as "scrypt$n$r$p$salt$hash" (base64 fields)."""
+    if salt is None:
+        salt = os.urandom(16)
+    digest = hashlib.scrypt(
+        password.encode(), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P
+    )
+    return "$".join(
+        ("scrypt", str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P), _b64(salt), _b64(digest))
+    )
 
 
 def verify_password(stored_password_hash, provided_password):
-    return stored_password_hash == hash_password(provided_password)
+    """Checks a password against a stored hash in constant time.
+
+    Also accepts the unsalted SHA-256 hex digests stored by older versions;
+    see password_needs_rehash.
+    """
+    password = provided_password.encode()
+    scheme = stored_password_hash.split("$", 1)[0]
+    if scheme == "scrypt":
+        _, n, r, p, salt, expected = stored_password_hash.split("$")
+        digest = hashlib.scrypt(
+            password, salt=base64.b64decode(salt), n=int(n), r=int(r), p=int(p)
+        )
+    else:
+        legacy_hash = hashlib.sha256(password).hexdigest()
+        return hmac.compare_digest(stored_password_hash, legacy_hash)
+    return hmac.compare_digest(_b64(digest), expected)
+
+
+def password_needs_rehash(stored_password_hash):
+    """True if the hash was not made by hash_password's current settings."""
+    return not stored_password_hash.startswith(
+        f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$"
+    )
 
 
 def create_user_in_db(username, password):
-    conn = get_db_connection()
-    c = conn.cursor()
-    try:
-        c.execute(
-            "INSERT INTO users (username, password_hash) VALUES (?, ?)",
-            (username, hash_password(password)),
-        )
-        conn.commit()
-        user_id = c.lastrowid
-        return user_id
-    except sqlite3.IntegrityError:  # Username already exists
-        return None
-    finally:
-        conn.close()
+    password_hash = hash_password(password)  # Hash before taking a pooled connection
+    with db_conn() as conn:
+        c = conn.cursor()
+        try:
+            # 'with conn' rolls back on failure so the pooled connection is not
+            # left inside an open transaction
+            with conn:
+                c.execute(
+                    "INSERT INTO users (username, password_hash) VALUES (?, ?)",
+                    (username, password_hash),
+                )
+            user_id = c.lastrowid
+            return user_id
+        except sqlite3.IntegrityError:  # Username already exists
+            return None
 
 
 def save_or_update_1rm(user_id, exercise, one_rep_max, rm_date):
@@ -176,67 +398,61 @@ def save_or_update_1rm(user_id, exercise, one_rep_max, rm_date):
     If a record for the exact user, exercise, and date exists, it updates it.
     Otherwise, it inserts a new record.
     """
-    conn = get_db_connection()
-    c = conn.cursor()
-    try:
-        # Try to update first if a record for that specific date exists
-        c.execute("""
-            UPDATE user_1rm SET one_rep_max = ?
-            WHERE user_id = ? AND exercise = ? AND date = ?
-        """, (one_rep_max, user_id, exercise, rm_date))
-
-        if c.rowcount == 0: # No record for that date, so insert
-            c.execute("""
-                INSERT INTO user_1rm (user_id, exercise, one_rep_max, date)
-                VALUES (?, ?, ?, ?)
-            """, (user_id, exercise, one_rep_max, rm_date))
-        conn.commit()
-        return True
-    except sqlite3.Error: # pragma: no cover
-        # Could be IntegrityError if UNIQUE constraint is violated by a different path,
-        # or other errors.
-        return False
-    finally:
-        conn.close()
+    with db_conn() as conn:
+        c = conn.cursor()
+        try:
+            with conn:  # Commits on success, rolls back on error
+                # One UPSERT on the UNIQUE(user_id, exercise, date) key
+                c.execute("""
+                    INSERT INTO user_1rm (user_id, exercise, one_rep_max, date)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(user_id, exercise, date)
+                    DO UPDATE SET one_rep_max = excluded.one_rep_max
+                """, (user_id, exercise, one_rep_max, rm_date))
+            return True
+        except sqlite3.Error: # pragma: no cover
+            # Could be IntegrityError if UNIQUE constraint is violated by a different path,
+            # or other errors.
+            return False
 
 
 def get_latest_1rm(user_id, exercise):
     """Fetches the most recent 1RM for a given user and exercise."""
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute("""
-        SELECT one_rep_max, date FROM user_1rm
-        WHERE user_id = ? AND exercise = ?
-        ORDER BY date DESC
-        LIMIT 1
-    """, (user_id, exercise))
-    result = c.fetchone()
-    conn.close()
-    return result # Returns a Row object (e.g., result['one_rep_max']) or None
+    with db_conn() as conn:
+        c = conn.cursor()
+        c.execute("""
+            SELECT one_rep_max, date FROM user_1rm
+            WHERE user_id = ? AND exercise = ?
+            ORDER BY date DESC
+            LIMIT 1
+        """, (user_id, exercise))
+        result = c.fetchone()
+        return result # Returns a Row object (e.g., result['one_rep_max']) or None
 
 
 def get_user_from_db(username):
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE username = ?", (username,))
-    user = c.fetchone()
-    conn.close()
-    return user
+    with db_conn() as conn:
+        c = conn.cursor()
+        c.execute(
+            "SELECT id, username, password_hash FROM users WHERE username = ? LIMIT 1",
+            (username,),
+        )
+        user = c.fetchone()
+        return user
 
 
 def update_user_password(user_id, new_password):
     """Updates the password_hash for a given user_id."""
-    conn = get_db_connection()
-    c = conn.cursor()
-    try:
-        c.execute(
-            "UPDATE users SET password_hash = ? WHERE id = ?",
-            (hash_password(new_password), user_id),
-        )
-        conn.commit()
-        return True
-    except sqlite3.Error:  # pragma: no cover
-        # Could be various errors, though less likely for a simple update by ID
-        return False
-    finally:
-        conn.close()
+    password_hash = hash_password(new_password)  # Hash before taking a pooled connection
+    with db_conn() as conn:
+        c = conn.cursor()
+        try:
+            with conn:  # Commits on success, rolls back on error
+                c.execute(
+                    "UPDATE users SET password_hash = ? WHERE id = ?",
+                    (password_hash, user_id),
+                )
+            return True
+        except sqlite3.Error:  # pragma: no cover
+            # Could be various errors, though less likely for a simple update by ID
+            return False
@@ -1,19 +1,34 @@
+import contextlib
+import sys
+import threading
+
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, Mock
+from types import SimpleNamespace
 import pandas as pd
-from datetime import date
-import os  # For managing temporary test database file
+from datetime import date, timedelta
+
+import database # Import the database module
+
+# Shared-cache in-memory DB: every connection in the process sees the same
+# database, and SQLite frees it once the last connection closes.
+TEST_DB_FILE = "file::memory:?cache=shared"
+
+# Computed once so every test, and every row within one, agrees on the day
+TODAY = date.today()
+TODAY_STR = TODAY.isoformat()
+YESTERDAY_STR = (TODAY - timedelta(days=1)).isoformat()
+
+# Point the database module at the test DB before importing app, so the
+# init_db that app runs on import never opens or creates the production file
+database.DB_NAME = TEST_DB_FILE
 
 # Before importing app, we need to ensure Streamlit's st object is minimally mocked
 # if we want to avoid errors for st.set_page_config, etc., during import.
 # However, for testing specific functions, we often mock 'st' more targetedly.
 # For now, let's assume app.py can be imported, and we'll mock 'st' within tests.
 
-import app  # This will run app.init_db() with the production DB_NAME once.
-import database # Import the database module
-
-
-TEST_DB_FILE = "test_workout_tracker.db"
+import app  # Runs init_db once, against TEST_DB_FILE
 
 
 @pytest.fixture
@@ -21,17 +36,21 @@ def test_db(monkeypatch):
     """Fixture to set up and tear down a temporary database for tests."""
     original_db_name = database.DB_NAME # Get original from database module
     monkeypatch.setattr(database, "DB_NAME", TEST_DB_FILE) # Patch DB_NAME in database module
+    # Users created here only need a valid hash, not a production-strength
+    # one; the auth tests below cover the real cost parameters
+    monkeypatch.setattr(database, "SCRYPT_N", 2**4)
 
-    if os.path.exists(TEST_DB_FILE):
-        os.remove(TEST_DB_FILE)
+    database.close_db_connections()  # Start from a fresh database and pool
     # app.init_db is database.init_db, which will now use the patched database.DB_NAME
-    app.init_db()  # Initialize schema in the test DB file
+    app.init_db()  # Initialize schema in the test DB
 
-    yield  # Test runs here
+    # One pooled connection for the test body's own reads and writes; app
+    # code checks out others from the same pool
+    with database.db_conn() as conn:
+        yield conn
 
-    # Teardown: remove test DB and restore original DB name
-    if os.path.exists(TEST_DB_FILE):
-        os.remove(TEST_DB_FILE)
+    # Teardown: closing the last connection discards the in-memory test DB
+    database.close_db_connections()
     monkeypatch.setattr(database, "DB_NAME", original_db_name) # Restore DB_NAME in database module
 
 
@@ -44,58 +63,45 @@ def active_user(test_db):
     return user_id
 
 
+class _SessionState(dict):
+    """Dict with attribute access, like Streamlit's st.session_state."""
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key) from None
+
+    __setattr__ = dict.__setitem__
+
+
 @pytest.fixture
 def mock_st_environment(monkeypatch, active_user):
     """Fixture to mock Streamlit's 'st' object and session state."""
     # active_user fixture ensures a user exists and db is set up
-    mock_st_obj = MagicMock()
     # Simulate logged-in user for most tests using this fixture
-    # Make session_state a MagicMock itself to allow attribute access and .get()
-    mock_session_state = MagicMock()
-    mock_session_state.user_id = active_user
-    mock_session_state.username = "test_active_user"
-    mock_session_state.logged_in = True  # Default to logged in for this fixture
-
-    # Define a side_effect for .get() to mimic Streamlit's SessionState behavior
-    def session_get_side_effect(key, default=None):
-        if key == "user_id":
-            return mock_session_state.user_id
-        if key == "username":
-            return mock_session_state.username
-        if key == "logged_in":
-            return mock_session_state.logged_in
-        # Fallback for other keys if needed, though not strictly necessary if only these are used
-        return getattr(mock_session_state, key, default)
-
-    mock_session_state.get = MagicMock(side_effect=session_get_side_effect)
-    mock_st_obj.session_state = mock_session_state
-
-    mock_st_obj.cache_data.clear = MagicMock()
-    mock_st_obj.rerun = MagicMock()
-    mock_st_obj.sidebar = MagicMock()
-    mock_st_obj.sidebar.title = MagicMock()
-    mock_st_obj.sidebar.radio = MagicMock()
-    mock_st_obj.sidebar.form = MagicMock()
-    mock_st_obj.sidebar.error = MagicMock()
-    mock_st_obj.sidebar.success = MagicMock()
-    mock_st_obj.info = MagicMock()
-    mock_st_obj.tabs = MagicMock()
-    mock_st_obj.header = MagicMock()
-    mock_st_obj.expander = MagicMock()
-    mock_st_obj.markdown = MagicMock()
-    mock_st_obj.table = MagicMock()
-    mock_st_obj.columns = MagicMock(return_value=(MagicMock(), MagicMock()))
-    mock_st_obj.date_input = MagicMock()
-    mock_st_obj.selectbox = MagicMock()
-    mock_st_obj.checkbox = MagicMock()
-    mock_st_obj.number_input = MagicMock()
-    mock_st_obj.slider = MagicMock()
-    mock_st_obj.button = MagicMock()
-    mock_st_obj.warning = MagicMock()
-    mock_st_obj.success = MagicMock()
-    mock_st_obj.error = MagicMock()
-    mock_st_obj.dataframe = MagicMock()
-    mock_st_obj.line_chart = MagicMock()
+    session_state = _SessionState(
+        user_id=active_user,
+        username="test_active_user",
+        logged_in=True,  # Default to logged in for this fixture
+        batch_saves=False,  # Save immediately unless a test opts in
+    )
+    # Only the st calls the save helpers make; a plain namespace of Mocks
+    # avoids MagicMock creating a child mock on every attribute access
+    mock_st_obj = SimpleNamespace(
+        session_state=session_state,
+        success=Mock(),
+        error=Mock(),
+        warning=Mock(),
+        info=Mock(),
+        cache_data=SimpleNamespace(clear=Mock()),
+    )
+
+    # Saves invalidate the cached readers individually rather than st.cache_data
+    table_versions = {}
+    monkeypatch.setattr(app, "_table_versions", lambda: table_versions)
+    monkeypatch.setattr(app.fetch_last_sets, "clear", Mock())
+    monkeypatch.setattr(app.load_progress, "clear", Mock())
 
     patcher = patch("app.st", mock_st_obj)
     patcher.start()
@@ -105,6 +111,37 @@ def mock_st_environment(monkeypatch, active_user):
     patcher.stop()
 
 
+def test_init_db_schema_version(test_db):
+    conn = test_db
+    # No user yet, so the orphan migration is still pending
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 0
+
+    app.create_user_in_db("schema_user", "pass")
+    app.init_db()
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == database.SCHEMA_VERSION
+
+    # Once current, init_db returns before running any DDL
+    conn.execute("DROP INDEX idx_cardio_user_date")
+    app.init_db()
+    index_count = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE name = 'idx_cardio_user_date'"
+    ).fetchone()[0]
+    assert index_count == 0
+
+
+def test_init_db_single_transaction(test_db):
+    statements = []
+    # Trace the idle pooled connection; the pool hands it straight to init_db
+    with database.db_conn() as conn:
+        conn.set_trace_callback(statements.append)
+    try:
+        app.init_db()  # Still pending: no user yet, so the DDL runs again
+    finally:
+        conn.set_trace_callback(None)
+    assert statements.count("BEGIN") == 1
+    assert statements.count("COMMIT") == 1
+
+
 # --- Auth Function Tests ---
 
 
@@ -122,6 +159,24 @@ def test_verify_password():
     assert app.verify_password(hashed, "wrongpassword") is False
 
 
+def test_hash_password_is_salted():
+    # Same password, different salt: different stored hashes that both verify
+    first, second = app.hash_password("testpassword"), app.hash_password("testpassword")
+    assert first != second
+    assert first.startswith("scrypt$")
+    assert app.verify_password(second, "testpassword") is True
+    assert database.password_needs_rehash(first) is False
+
+
+def test_verify_password_legacy_sha256():
+    import hashlib
+
+    legacy_hash = hashlib.sha256(b"testpassword").hexdigest()
+    assert app.verify_password(legacy_hash, "testpassword") is True
+    assert app.verify_password(legacy_hash, "wrongpassword") is False
+    assert database.password_needs_rehash(legacy_hash) is True
+
+
 def test_create_user_in_db(test_db):  # Uses test_db fixture
     # Test successful user creation
     user_id = app.create_user_in_db("testuser_auth", "password123")
@@ -131,6 +186,8 @@ def test_create_user_in_db(test_db):  # Uses test_db fixture
     # Test duplicate username
     duplicate_user_id = app.create_user_in_db("testuser_auth", "anotherpassword")
     assert duplicate_user_id is None
+    # The failed insert is rolled back, leaving the pooled connection usable
+    assert app.create_user_in_db("testuser_auth_2", "password123") is not None
 
 
 def test_get_user_from_db(test_db):  # Uses test_db fixture
@@ -172,68 +229,62 @@ def test_update_user_password(test_db): # Uses test_db fixture
                                # No rows affected is not an error. This is acceptable.
 
 
-def test_save_or_update_1rm(active_user): # Uses active_user fixture (which implies test_db)
+def test_save_or_update_1rm(active_user, test_db): # Uses active_user fixture
     user_id = active_user
     exercise = "Back-squat"
-    today_iso = date.today().isoformat()
-    tomorrow_iso = (date.today() + pd.Timedelta(days=1)).isoformat()
+    tomorrow_iso = (TODAY + timedelta(days=1)).isoformat()
 
     # 1. Save a new 1RM
-    success_save = database.save_or_update_1rm(user_id, exercise, 100.0, today_iso)
+    success_save = database.save_or_update_1rm(user_id, exercise, 100.0, TODAY_STR)
     assert success_save is True
-    conn = database.get_db_connection()
+    conn = test_db
     c = conn.cursor()
-    c.execute("SELECT one_rep_max, date FROM user_1rm WHERE user_id = ? AND exercise = ? AND date = ?", (user_id, exercise, today_iso))
+    c.execute("SELECT one_rep_max, date FROM user_1rm WHERE user_id = ? AND exercise = ? AND date = ?", (user_id, exercise, TODAY_STR))
     result = c.fetchone()
     assert result is not None
     assert result["one_rep_max"] == 100.0
-    conn.close()
 
     # 2. Update an existing 1RM for the same date
-    success_update = database.save_or_update_1rm(user_id, exercise, 105.0, today_iso)
+    success_update = database.save_or_update_1rm(user_id, exercise, 105.0, TODAY_STR)
     assert success_update is True
-    conn = database.get_db_connection()
+    conn = test_db
     c = conn.cursor()
-    c.execute("SELECT one_rep_max FROM user_1rm WHERE user_id = ? AND exercise = ? AND date = ?", (user_id, exercise, today_iso))
+    c.execute("SELECT one_rep_max FROM user_1rm WHERE user_id = ? AND exercise = ? AND date = ?", (user_id, exercise, TODAY_STR))
     result = c.fetchone()
     assert result["one_rep_max"] == 105.0
     # Ensure only one record for that date
-    c.execute("SELECT COUNT(*) FROM user_1rm WHERE user_id = ? AND exercise = ? AND date = ?", (user_id, exercise, today_iso))
+    c.execute("SELECT COUNT(*) FROM user_1rm WHERE user_id = ? AND exercise = ? AND date = ?", (user_id, exercise, TODAY_STR))
     count = c.fetchone()[0]
     assert count == 1
-    conn.close()
 
     # 3. Save a new 1RM for a different date (should be a new record)
     success_save_new_date = database.save_or_update_1rm(user_id, exercise, 110.0, tomorrow_iso)
     assert success_save_new_date is True
-    conn = database.get_db_connection()
+    conn = test_db
     c = conn.cursor()
     c.execute("SELECT COUNT(*) FROM user_1rm WHERE user_id = ? AND exercise = ?", (user_id, exercise))
     count = c.fetchone()[0]
     assert count == 2 # One for today, one for tomorrow
-    conn.close()
 
 
 def test_get_latest_1rm(active_user): # Uses active_user fixture
     user_id = active_user
     exercise = "Bench Press"
-    today_iso = date.today().isoformat()
-    yesterday_iso = (date.today() - pd.Timedelta(days=1)).isoformat()
-    day_before_yesterday_iso = (date.today() - pd.Timedelta(days=2)).isoformat()
+    day_before_yesterday_iso = (TODAY - timedelta(days=2)).isoformat()
 
     # 1. No 1RM logged yet
     latest = database.get_latest_1rm(user_id, exercise)
     assert latest is None
 
     # 2. Log some 1RMs
-    database.save_or_update_1rm(user_id, exercise, 80.0, yesterday_iso)
+    database.save_or_update_1rm(user_id, exercise, 80.0, YESTERDAY_STR)
     database.save_or_update_1rm(user_id, exercise, 75.0, day_before_yesterday_iso)
-    database.save_or_update_1rm(user_id, exercise, 82.5, today_iso) # Most recent
+    database.save_or_update_1rm(user_id, exercise, 82.5, TODAY_STR) # Most recent
 
     latest = database.get_latest_1rm(user_id, exercise)
     assert latest is not None
     assert latest["one_rep_max"] == 82.5
-    assert latest["date"] == today_iso
+    assert latest["date"] == TODAY_STR
 
     # 3. Check for an exercise with no 1RMs
     latest_other_ex = database.get_latest_1rm(user_id, "Deadlift")
@@ -245,7 +296,7 @@ def test_get_latest_1rm(active_user): # Uses active_user fixture
 
 def test_add_column_if_not_exists(test_db):  # Uses test_db fixture
     # This test doesn't involve st.cache_data on the function being tested, so no changes needed here.
-    conn = app.get_db_connection()
+    conn = test_db
     c = conn.cursor()
 
     # Test adding a new column
@@ -260,14 +311,15 @@ def test_add_column_if_not_exists(test_db):  # Uses test_db fixture
     columns_after_second_call = [row[1] for row in c.fetchall()]
     assert columns == columns_after_second_call
 
-    conn.close()
+    # A shared dict caches the column list and records added columns
+    table_columns = {}
+    database._add_column_if_not_exists(c, "users", "nickname", "TEXT", table_columns)
+    assert {"email", "nickname"} <= table_columns["users"]
 
 
-def test_load_table(
-    active_user, monkeypatch
-):  # Uses active_user fixture (which implies test_db)
+def test_load_table(active_user, test_db, monkeypatch):  # Uses active_user fixture
     # Temporarily replace the cached function with its original, undecorated version
-    monkeypatch.setattr(app, "load_table", app.load_table.__wrapped__)
+    monkeypatch.setattr(app, "_load_table", app._load_table.__wrapped__)
 
     test_user_id = active_user
     # Test loading an empty table
@@ -276,28 +328,25 @@ def test_load_table(
     assert df_empty.empty is True
 
     # Insert some data for the test user
-    conn = app.get_db_connection()
+    conn = test_db
     c = conn.cursor()
-    today_str = date.today().isoformat()
-    c.execute(
-        "INSERT INTO resistance (user_id, date, week, day, exercise, set_number, target, actual_weight, actual_reps, rir) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-        (test_user_id, today_str, 1, "Monday", "Squat", 1, "5x5", 100, 5, 2),
-    )
-    conn.commit()
-    conn.close()
+    with conn:
+        c.execute(
+            app.RESISTANCE_INSERT_SQL,
+            (test_user_id, TODAY_STR, 1, "Monday", "Squat", 1, "5x5", 100, 5, 2),
+        )
 
     df_with_data = app.load_table("resistance", test_user_id)
     assert df_with_data.empty is False
     assert len(df_with_data) == 1
     assert df_with_data.iloc[0]["exercise"] == "Squat"
+    # Only the displayed columns are read
+    assert tuple(df_with_data.columns) == app.TABLE_COLUMNS["resistance"]
 
     # Test loading for another user (who has no data)
-    conn_temp = app.get_db_connection()  # Need a connection to create another user
-    c_temp = conn_temp.cursor()
     # Manually create another user for this specific test case, as active_user is fixed
     other_user_id = app.create_user_in_db("otherdatauser", "pass")
     assert other_user_id is not None
-    conn_temp.close()
 
     df_other_user = app.load_table("resistance", other_user_id)
     assert df_other_user.empty is True
@@ -305,96 +354,140 @@ def test_load_table(
     # Test loading with None user_id
     df_none_user = app.load_table("resistance", None)
     assert df_none_user.empty is True
+    assert df_none_user is app._EMPTY_DF  # Shared frame, nothing built
+
+
+def test_load_table_limit(active_user, test_db, monkeypatch):
+    monkeypatch.setattr(app, "_load_table", app._load_table.__wrapped__)
 
+    test_user_id = active_user
+    conn = test_db
+    c = conn.cursor()
+    with conn:  # One transaction for all rows
+        c.executemany(
+            app.CARDIO_INSERT_SQL,
+            [
+                (test_user_id, YESTERDAY_STR, "Zone-2 Run", 60, 130),
+                (test_user_id, TODAY_STR, "HIIT (4×4)", 30, 160),
+            ],
+        )
 
-def test_fetch_last(active_user, monkeypatch):  # Uses active_user fixture
+    # The limit keeps the newest rows
+    df_limited = app.load_table("cardio", test_user_id, limit=1)
+    assert len(df_limited) == 1
+    assert df_limited.iloc[0]["type"] == "HIIT (4×4)"
+
+    assert len(app.load_table("cardio", test_user_id)) == 2
+
+
+def test_fetch_last_sets(active_user, test_db, monkeypatch):  # Uses active_user fixture
     # Temporarily replace the cached function with its original, undecorated version
-    monkeypatch.setattr(app, "fetch_last", app.fetch_last.__wrapped__)
+    monkeypatch.setattr(app, "fetch_last_sets", app.fetch_last_sets.__wrapped__)
 
     test_user_id = active_user
     # Test fetching when no data exists
-    last = app.fetch_last("Squat", 1, test_user_id)
-    assert last == (None, None, None)
+    assert app.fetch_last_sets("Squat", test_user_id) == {}
 
-    # Insert data
-    conn = app.get_db_connection()
+    conn = test_db
     c = conn.cursor()
-    today_str = date.today().isoformat()
-    c.execute(
-        "INSERT INTO resistance (user_id, date, week, day, exercise, set_number, target, actual_weight, actual_reps, rir) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-        (test_user_id, today_str, 1, "Monday", "Squat", 1, "5x5", 100.0, 5, 2),
-    )
-    # Insert an older record to ensure the latest is fetched
-    older_date_str = (date.today() - pd.Timedelta(days=1)).isoformat()
-    c.execute(
-        "INSERT INTO resistance (user_id, date, week, day, exercise, set_number, target, actual_weight, actual_reps, rir) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-        (test_user_id, older_date_str, 1, "Monday", "Squat", 1, "5x5", 90.0, 5, 3),
-    )
-    conn.commit()
-    conn.close()
+    with conn:  # One transaction for all rows
+        c.executemany(
+            app.RESISTANCE_INSERT_SQL,
+            [
+                (test_user_id, YESTERDAY_STR, 1, "Monday", "Squat", 1, "5x5", 90.0, 5, 3),
+                (test_user_id, YESTERDAY_STR, 1, "Monday", "Squat", 2, "5x5", 92.5, 4, 2),
+                (test_user_id, TODAY_STR, 1, "Monday", "Squat", 1, "5x5", 100.0, 5, 2),
+            ],
+        )
+
+    # Set 1 comes from today, set 2 only exists in the older session
+    last = app.fetch_last_sets("Squat", test_user_id)
+    assert last == {1: (100.0, 5, 2), 2: (92.5, 4, 2)}
 
-    weight, reps, rir = app.fetch_last("Squat", 1, test_user_id)
-    assert weight == 100.0
-    assert reps == 5
-    assert rir == 2
+    assert app.fetch_last_sets("Bench", test_user_id) == {}
+    assert app.fetch_last_sets("Squat", None) == {}
 
-    # Test fetching for an exercise that doesn't exist for the user
-    last_other_ex = app.fetch_last("Bench", 1, test_user_id)
-    assert last_other_ex == (None, None, None)
 
-    # Test fetching with None user_id
-    last_none_user = app.fetch_last("Squat", 1, None)
-    assert last_none_user == (None, None, None)
+def test_load_progress(active_user, test_db, monkeypatch):  # Uses active_user fixture
+    monkeypatch.setattr(app, "load_progress", app.load_progress.__wrapped__)
+
+    test_user_id = active_user
+    assert app.load_progress(test_user_id).empty is True
+
+    conn = test_db
+    c = conn.cursor()
+    with conn:  # One transaction for all rows
+        c.executemany(
+            app.RESISTANCE_INSERT_SQL,
+            [
+                (test_user_id, YESTERDAY_STR, 1, "Monday", "Squat", 1, "5x5", 90.0, 5, 3),
+                (test_user_id, TODAY_STR, 1, "Monday", "Squat", 1, "5x5", 100.0, 5, 2),
+                (test_user_id, TODAY_STR, 1, "Monday", "Squat", 2, "5x5", 105.0, 3, 1),
+                (test_user_id, TODAY_STR, 1, "Monday", "Bench", 1, "5x5", 70.0, 5, 2),
+            ],
+        )
+
+    df = app.load_progress(test_user_id)
+    # One row per (exercise, day), oldest first
+    assert len(df) == 3
+    squat = df[df["exercise"] == "Squat"]
+    assert squat["max_weight"].tolist() == [90.0, 105.0]
+    assert squat["date"].is_monotonic_increasing
+
+    assert app.load_progress(None).empty is True
 
 
 # --- _save_form_data Function Tests ---
 
 
-def test_save_form_data_single_insert(mock_st_environment, active_user):
+def test_save_form_data_single_insert(mock_st_environment, active_user, test_db):
     mock_st = mock_st_environment  # Get the mocked st object
     test_user_id = active_user  # Get the user_id from active_user fixture
 
-    today_str = date.today().isoformat()
-    query = "INSERT INTO mobility(user_id, date, prep_done, joint_flow_done, animal_circuit_done, cuff_finisher_done) VALUES(?,?,?,?,?,?)"
-    payload = (test_user_id, today_str, 1, 1, 0, 0)
+    query = app.MOBILITY_INSERT_SQL
+    payload = (test_user_id, TODAY_STR, 1, 1, 0, 0)
 
     app._save_form_data(query, payload, "Saved Mobility")
 
     mock_st.success.assert_called_with("Saved Mobility")
-    mock_st.cache_data.clear.assert_called_once()
+    # Only the mobility reads are invalidated
+    assert app._table_versions() == {"mobility": 1}
+    app.fetch_last_sets.clear.assert_not_called()
+    app.load_progress.clear.assert_not_called()
+    mock_st.cache_data.clear.assert_not_called()
 
     # Verify data in DB
-    conn = app.get_db_connection()
+    conn = test_db
     c = conn.cursor()
     c.execute("SELECT * FROM mobility WHERE user_id = ?", (test_user_id,))
     row = c.fetchone()
     assert row is not None
     assert row["prep_done"] == 1
-    conn.close()
 
 
-def test_save_form_data_many_insert(mock_st_environment, active_user):
+def test_save_form_data_many_insert(mock_st_environment, active_user, test_db):
     mock_st = mock_st_environment
     test_user_id = active_user
 
-    today_str = date.today().isoformat()
-    query = "INSERT INTO resistance(user_id,date,week,day,exercise,set_number,target,actual_weight,actual_reps,rir) VALUES(?,?,?,?,?,?,?,?,?,?)"
+    query = app.RESISTANCE_INSERT_SQL
     payload = [
-        (test_user_id, today_str, 1, "Mon", "Squat", 1, "5x5", 100, 5, 2),
-        (test_user_id, today_str, 1, "Mon", "Squat", 2, "5x5", 100, 5, 1),
+        (test_user_id, TODAY_STR, 1, "Mon", "Squat", 1, "5x5", 100, 5, 2),
+        (test_user_id, TODAY_STR, 1, "Mon", "Squat", 2, "5x5", 100, 5, 1),
     ]
 
     app._save_form_data(query, payload, "Saved Resistance", is_many=True)
 
     mock_st.success.assert_called_with("Saved Resistance")
-    mock_st.cache_data.clear.assert_called_once()
+    assert app._table_versions() == {"resistance": 1}
+    app.fetch_last_sets.clear.assert_called_once()
+    app.load_progress.clear.assert_called_once()
+    mock_st.cache_data.clear.assert_not_called()
 
-    conn = app.get_db_connection()
+    conn = test_db
     c = conn.cursor()
     c.execute("SELECT COUNT(*) FROM resistance WHERE user_id = ?", (test_user_id,))
     count = c.fetchone()[0]
     assert count == 2
-    conn.close()
 
 
 def test_save_form_data_no_user_logged_in(mock_st_environment):
@@ -408,6 +501,7 @@ def test_save_form_data_no_user_logged_in(mock_st_environment):
     mock_st.error.assert_called_with("User not logged in. Cannot save data.")
     mock_st.success.assert_not_called()
     mock_st.cache_data.clear.assert_not_called()
+    assert app._table_versions() == {}
 
 
 def test_save_form_data_empty_payload_for_many(mock_st_environment):
@@ -419,3 +513,260 @@ def test_save_form_data_empty_payload_for_many(mock_st_environment):
     mock_st.warning.assert_called_with("No data to save.")
     mock_st.success.assert_not_called()
     mock_st.cache_data.clear.assert_not_called()
+    assert app._table_versions() == {}
+
+
+def test_save_form_data_skips_unchanged_resubmit(mock_st_environment, active_user, test_db):
+    mock_st = mock_st_environment
+    test_user_id = active_user
+    query = app.CARDIO_INSERT_SQL
+    payload = (test_user_id, TODAY_STR, "Zone-2 Run", 45, 135)
+
+    app._save_form_data(query, payload, "Saved Cardio", dedupe_key="last_cardio")
+    assert mock_st.session_state["last_cardio"] == payload
+    mock_st.success.assert_called_once_with("Saved Cardio")
+
+    # Same payload again: nothing is written
+    app._save_form_data(query, payload, "Saved Cardio", dedupe_key="last_cardio")
+    mock_st.info.assert_called_with("No changes since the last save.")
+    mock_st.success.assert_called_once()
+
+    # A changed payload is saved
+    app._save_form_data(
+        query, payload[:3] + (50, 135), "Saved Cardio", dedupe_key="last_cardio"
+    )
+    assert mock_st.success.call_count == 2
+
+    conn = test_db
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*) FROM cardio WHERE user_id = ?", (test_user_id,))
+    assert c.fetchone()[0] == 2
+
+
+def test_commit_pending_writes(mock_st_environment, active_user, test_db):
+    mock_st = mock_st_environment
+    test_user_id = active_user
+    mock_st.session_state.batch_saves = True
+    mock_st.session_state.pending_writes = []
+
+    mob_query = app.MOBILITY_INSERT_SQL
+    car_query = app.CARDIO_INSERT_SQL
+
+    # In batch mode saves are only queued
+    app._save_form_data(mob_query, (test_user_id, TODAY_STR, 1, 0, 1, 0), "Saved Mobility")
+    app._save_form_data(car_query, (test_user_id, TODAY_STR, "Zone-2 Run", 45, 135), "Saved Cardio")
+    assert len(mock_st.session_state.pending_writes) == 2
+    mock_st.info.assert_called_with("Queued: Saved Cardio")
+    assert app._table_versions() == {}
+
+    conn = test_db
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*) FROM cardio WHERE user_id = ?", (test_user_id,))
+    assert c.fetchone()[0] == 0
+
+    # Committing writes the whole queue at once
+    app._commit_pending_writes()
+    mock_st.success.assert_called_with("Saved 2 pending entries.")
+    assert mock_st.session_state.pending_writes == []
+    assert app._table_versions() == {"mobility": 1, "cardio": 1}
+
+    conn = test_db
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*) FROM mobility WHERE user_id = ?", (test_user_id,))
+    assert c.fetchone()[0] == 1
+    c.execute("SELECT COUNT(*) FROM cardio WHERE user_id = ?", (test_user_id,))
+    assert c.fetchone()[0] == 1
+
+
+def test_queued_save_is_not_deduped_after_logout(mock_st_environment, active_user, test_db):
+    mock_st = mock_st_environment
+    test_user_id = active_user
+    mock_st.session_state.batch_saves = True
+    query = app.CARDIO_INSERT_SQL
+    payload = (test_user_id, TODAY_STR, "Zone-2 Run", 45, 135)
+
+    app._save_form_data(query, payload, "Saved Cardio", dedupe_key="last_cardio")
+    mock_st.info.assert_called_with("Queued: Saved Cardio")
+    assert "last_cardio" not in mock_st.session_state  # Not saved yet
+
+    # Logging out drops the queue; the same entry can be saved again afterwards
+    app._logout()
+    assert mock_st.session_state.pending_writes == []
+    mock_st.session_state.user_id = test_user_id
+    app._save_form_data(query, payload, "Saved Cardio", dedupe_key="last_cardio")
+    mock_st.info.assert_called_with("Queued: Saved Cardio")
+    app._save_form_data(query, payload, "Saved Cardio", dedupe_key="last_cardio")
+    mock_st.info.assert_called_with("Already queued.")
+    assert len(mock_st.session_state.pending_writes) == 1
+
+    app._commit_pending_writes()
+    assert mock_st.session_state["last_cardio"] == payload
+    app._save_form_data(query, payload, "Saved Cardio", dedupe_key="last_cardio")
+    mock_st.info.assert_called_with("No changes since the last save.")
+
+    c = test_db.cursor()
+    c.execute("SELECT COUNT(*) FROM cardio WHERE user_id = ?", (test_user_id,))
+    assert c.fetchone()[0] == 1
+
+
+def test_db_conn_reuses_pooled_connections(test_db):
+    with database.db_conn() as conn:
+        pass
+
+    # Short-lived threads, like Streamlit's per-rerun script threads, borrow
+    # the idle connection instead of each opening their own
+    borrowed = []
+
+    def worker():
+        with database.db_conn() as worker_conn:
+            borrowed.append(worker_conn)
+
+    for _ in range(20):
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+    assert all(worker_conn is conn for worker_conn in borrowed)
+    assert database._pools[database.DB_NAME].opened == 2  # test_db's and conn
+
+
+def _borrow_connection():
+    with database.db_conn():
+        pass
+
+
+def test_db_conn_pool_is_bounded(test_db):
+    pool = database._pools[database.DB_NAME]
+    with contextlib.ExitStack() as stack:
+        # test_db holds one connection; check out the rest
+        held = [
+            stack.enter_context(database.db_conn())
+            for _ in range(database.POOL_SIZE - 1)
+        ]
+        waiter = threading.Thread(target=_borrow_connection, daemon=True)
+        waiter.start()
+        waiter.join(timeout=0.2)
+        assert waiter.is_alive()  # Waits rather than opening another connection
+        assert pool.opened == database.POOL_SIZE
+    waiter.join(timeout=5)
+    assert not waiter.is_alive()  # Got a released connection
+    assert len(held) == database.POOL_SIZE - 1
+
+
+def test_db_conn_rolls_back_on_release(test_db):
+    with database.db_conn() as conn:
+        conn.execute("INSERT INTO users (username, password_hash) VALUES ('x', 'y')")
+        assert conn.in_transaction
+    assert conn.in_transaction is False
+    assert app.get_user_from_db("x") is None
+
+
+def test_db_conn_drops_unusable_connection(test_db):
+    pool = database._pools[database.DB_NAME]
+    with database.db_conn() as conn:
+        conn.close()  # Rolling it back on release now fails
+    assert pool.opened == 1  # Its slot is free again; only test_db's is left
+    with database.db_conn() as fresh:
+        assert fresh is not conn
+        fresh.execute("SELECT 1")
+
+
+def test_db_conn_times_out_when_pool_is_exhausted(test_db, monkeypatch):
+    monkeypatch.setattr(database, "POOL_TIMEOUT", 0.1)
+    with contextlib.ExitStack() as stack:
+        for _ in range(database.POOL_SIZE - 1):
+            stack.enter_context(database.db_conn())
+        with pytest.raises(database.sqlite3.OperationalError, match="released"):
+            _borrow_connection()
+
+
+def test_close_db_connections(test_db):
+    with database.db_conn() as conn:
+        pass
+    database.close_db_connections()
+    with pytest.raises(database.sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")  # Idle connections are closed
+    test_db.execute("SELECT 1")  # A checked-out one is left alone
+
+
+def test_clear_cached_reads_is_per_table(active_user, test_db, monkeypatch):
+    test_user_id = active_user
+    versions = {}
+    monkeypatch.setattr(app, "_table_versions", lambda: versions)
+    app._load_table.clear()
+
+    conn = test_db
+    assert app.load_table("cardio", test_user_id).empty
+    assert app.load_table("mobility", test_user_id).empty
+    with conn:
+        conn.execute(app.CARDIO_INSERT_SQL, (test_user_id, TODAY_STR, "Run", 30, 140))
+        conn.execute(app.MOBILITY_INSERT_SQL, (test_user_id, TODAY_STR, 1, 1, 1, 1))
+
+    app._clear_cached_reads({"cardio"})
+    assert len(app.load_table("cardio", test_user_id)) == 1  # Re-read
+    assert app.load_table("mobility", test_user_id).empty  # Still cached
+    app._load_table.clear()
+
+
+def test_clear_cached_reads_concurrent_bumps(monkeypatch):
+    versions = {}
+    monkeypatch.setattr(app, "_table_versions", lambda: versions)
+
+    def saver():
+        for _ in range(500):
+            app._clear_cached_reads({"cardio"})
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # Switch threads often to expose lost updates
+    try:
+        threads = [threading.Thread(target=saver) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert versions == {"cardio": 8 * 500}
+
+
+def test_execute_write_multi_row(active_user, test_db):
+    test_user_id = active_user
+    conn = test_db
+    rows = [
+        (test_user_id, "2024-01-01", "Run", 30, 140),
+        (test_user_id, "2024-01-02", "Bike", 45, 130),
+        (test_user_id, "2024-01-03", "Row", 20, 150),
+    ]
+    with conn:
+        app._execute_write(
+            conn,
+            app.CARDIO_INSERT_SQL,
+            rows,
+            is_many=True,
+        )
+    saved = conn.execute(
+        "SELECT user_id, date, type, duration_min, avg_hr FROM cardio ORDER BY id"
+    ).fetchall()
+    assert [tuple(row) for row in saved] == rows
+
+
+def test_foreign_keys_enforced(test_db):
+    conn = test_db
+    assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+    with pytest.raises(database.sqlite3.IntegrityError):
+        with conn:
+            conn.execute(app.CARDIO_INSERT_SQL, (9999, "2024-01-01", "Run", 30, 140))
+
+
+def test_connection_uses_wal(test_db, monkeypatch, tmp_path):
+    # journal_mode is a property of the file, so this needs a real one
+    monkeypatch.setattr(database, "DB_NAME", str(tmp_path / "wal_test.db"))
+    with database.db_conn() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    # WAL mode is stored in the database file, so new connections see it too
+    database.close_db_connections()
+    import sqlite3
+
+    raw_conn = sqlite3.connect(database.DB_NAME)
+    assert raw_conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    raw_conn.close()